@@ -1,9 +1,9 @@
 
 from helpers import *
+from helpers.download import download_if_modified
 import gzip
 import re
 from apt_pkg import TagFile, version_compare, init
-import requests
 import os
 
 def package_list_to_dict(pkg_list):
@@ -37,9 +37,7 @@ class DebianPkgInfoRetriever(PkgInfoRetriever):
                 save_dir = os.path.join(cache_dir, suite['name'], component)
                 if not os.path.exists(save_dir):
                     os.makedirs(save_dir)
-                r = requests.get(url)
-                with open(os.path.join(save_dir, "Packages-amd64.gz"), "wb") as code:
-                    code.write(r.content)
+                download_if_modified(url, os.path.join(save_dir, "Packages-amd64.gz"))
 
     def _get_upstream_version (self, version):
         v = no_epoch(version)
@@ -1,71 +1,70 @@
 
 from helpers.distro import *
 from helpers.rpm_export import RpmMd, RpmMdException
+from helpers.download import fetch, download_file
+from helpers.pkgcache import PackageCacheReader, PackageCacheError
 import os
 import sys
-from urllib2 import urlopen
 import re
 import libarchive
-import gzip
+from functools import partial
 
 class FedoraDataRetriever(DistroDataRetriever):
     def __init__(self):
         DistroDataRetriever.__init__(self, "Fedora")
 
-    def update_caches(self):
-        for r in self.config['releases']:
-            fedora_release = str(r['version'])
-            cachedir = os.path.join(self.get_cache_path(), "tmp", fedora_release)
-            metadatadir = os.path.join(self.get_metadata_path(), fedora_release)
-
-            if r.get('development'):
-                repo_url = "http://dl.fedoraproject.org/pub/fedora/linux/development/%s/x86_64/os/" % (fedora_release)
-            else:
-                repo_url = "http://dl.fedoraproject.org/pub/fedora/linux/releases/%s/Fedora/x86_64/os/" % (fedora_release)
-
-            metadata = RpmMd(repo_url, cachedir)
-            try:
-                metadata.fetch_and_parse()
-            except RpmMdException as e:
-                metadata.cleanup()
-                print(e)
-                sys.exit(2)
-
-            outdir = os.path.join(self.get_cache_path(), "packages", fedora_release)
-            metadata.export_data(fedora_release, "fedora", outdir=outdir)
-            metadata.cleanup(keep_cache=True)
-
-            # download AppStream data
-            urlpath = urlopen(os.path.join(repo_url, "Packages/a/"))
-            p_index = urlpath.read().decode('utf-8')
-
-            pattern = re.compile('appstream-data.*.noarch.rpm"')
-            filelist = pattern.findall(p_index)
-            if not filelist:
-                continue
-
-            filename = filelist[0][:-1]
-            remotefile = urlopen(os.path.join(repo_url, "Packages/a/", filename))
-
-            tmpfile = os.path.join(cachedir, filename)
-            localfile = open(tmpfile, 'w')
-            localfile.write(remotefile.read())
-            remotefile.close()
-            localfile.close()
-
-            common_prefix = "./usr/share/app-info/"
-            with libarchive.SeekableArchive(tmpfile) as a:
-                for entry in a:
-                    path = os.path.join(metadatadir, os.path.relpath(entry.pathname, common_prefix))
-                    if entry.isdir():
-                        if not os.path.exists(path):
-                            os.makedirs(path)
-                    else:
-                        f = open(path, 'wb')
+    def _update_release_cache(self, r):
+        fedora_release = str(r['version'])
+        cachedir = os.path.join(self.get_cache_path(), "tmp", fedora_release)
+        metadatadir = os.path.join(self.get_metadata_path(), fedora_release)
+
+        if r.get('development'):
+            repo_url = "http://dl.fedoraproject.org/pub/fedora/linux/development/%s/x86_64/os/" % (fedora_release)
+        else:
+            repo_url = "http://dl.fedoraproject.org/pub/fedora/linux/releases/%s/Fedora/x86_64/os/" % (fedora_release)
+
+        metadata = RpmMd(repo_url, cachedir)
+        try:
+            metadata.fetch_and_parse()
+        except RpmMdException as e:
+            metadata.cleanup()
+            raise e
+
+        outdir = os.path.join(self.get_cache_path(), "packages", fedora_release)
+        metadata.export_data(fedora_release, "fedora", outdir=outdir)
+        metadata.cleanup(keep_cache=True)
+
+        # download AppStream data
+        p_index = fetch(os.path.join(repo_url, "Packages/a/")).decode('utf-8')
+
+        pattern = re.compile('appstream-data.*.noarch.rpm"')
+        filelist = pattern.findall(p_index)
+        if not filelist:
+            return
+
+        filename = filelist[0][:-1]
+        tmpfile = os.path.join(cachedir, filename)
+        download_file(os.path.join(repo_url, "Packages/a/", filename), tmpfile)
+
+        common_prefix = "./usr/share/app-info/"
+        with libarchive.SeekableArchive(tmpfile) as a:
+            for entry in a:
+                path = os.path.join(metadatadir, os.path.relpath(entry.pathname, common_prefix))
+                if entry.isdir():
+                    if not os.path.exists(path):
+                        os.makedirs(path)
+                else:
+                    # replace files instead of rewriting them, as icons may be hardlinked into the icon cache
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, 'wb') as f:
                         f.write(a.read(entry.pathname))
-                        f.close()
-
+                    os.rename(tmp_path, path)
 
+    def get_cache_update_tasks(self):
+        tasks = list()
+        for r in self.config['releases']:
+            tasks.append((str(r['name']), partial(self._update_release_cache, r)))
+        return tasks
 
     def _get_upstream_version (self, version):
         v = no_epoch(version)
@@ -73,9 +72,21 @@ class FedoraDataRetriever(DistroDataRetriever):
             v = v[:v.index("-")]
         return v
 
-    def get_components_packages(self):
-        pkgs = list()
+    def _get_release_input_files(self, codename):
         for rel in self.config['releases']:
+            if str(rel['name']) != codename:
+                continue
+            fedora_release = str(rel['version'])
+            # repomd.xml holds the checksums of all other repository metadata
+            paths = list_files(os.path.join(self.get_metadata_path(), fedora_release))
+            paths.append(os.path.join(self.get_cache_path(), "tmp", fedora_release, "repodata", "repomd.xml"))
+            return paths
+        return list()
+
+    def get_components_packages(self, releases=None):
+        for rel in self.config['releases']:
+            if releases is not None and str(rel['name']) not in releases:
+                continue
             fedora_release = str(rel['version'])
             pkgcache = os.path.join(self.get_cache_path(), "packages", fedora_release, "dist-%s" % (fedora_release))
             metadatadir = os.path.join(self.get_metadata_path(), fedora_release)
@@ -83,27 +94,20 @@ class FedoraDataRetriever(DistroDataRetriever):
             # get list of AppStream components for the given distro
             ascpts = self.get_appstream_components(metadatadir)
 
-            docs = list()
+            cached_pkgs = list()
             try:
-                docs = yaml.load_all(gzip.open(os.path.join(pkgcache, "packages.gz"), 'r'))
-            except:
+                cached_pkgs = PackageCacheReader(open(os.path.join(pkgcache, "packages.bin"), 'rb'))
+            except (IOError, PackageCacheError):
                 print("Skipping Fedora %s: No packages found" % (fedora_release))
-            for doc in docs:
-                pkgname = doc['Package']
-                cpt = ascpts.get(pkgname)
+            for pkg in cached_pkgs:
+                cpt = ascpts.get(pkg.name)
                 if not cpt:
                     continue
-                pkg = PackageInfo(pkgname,
-                              doc['Version'],
-                              doc['UpstreamVersion'],
-                              doc['Architecture'],
-                              str(rel['name']))
-
-                pkg.url = "https://apps.fedoraproject.org/packages/%s" % (pkgname)
+                pkg.distro_release = intern_string(str(rel['name']))
+                pkg.url = "https://apps.fedoraproject.org/packages/%s" % (pkg.name)
                 pkg.cpt = cpt
-                pkgs.append(pkg)
-        return pkgs
+                yield pkg
 
 if __name__ == '__main__':
     test = FedoraDataRetriever()
-    print(test.get_components_packages())
+    print(list(test.get_components_packages()))
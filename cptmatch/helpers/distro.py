@@ -1,8 +1,12 @@
 
 import yaml
 import os
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 from gi.repository import Appstream
-from distutils.version import LooseVersion
 
 def no_epoch(version):
     v = version
@@ -11,14 +15,52 @@ def no_epoch(version):
     else:
         return v
 
-class PackageInfo():
+def list_files(path):
+    """ Get the paths of all files below path """
+    files = list()
+    for root, dirs, filenames in os.walk(path):
+        for filename in filenames:
+            files.append(os.path.join(root, filename))
+    return files
+
+def hash_files(paths):
+    """ Get a checksum over the names, sizes and modification times of a list of files
+
+    The files are never read, so checking large unchanged trees (AppStream
+    data with all its icons, package caches) is cheap. Downloads and extracted
+    files replace the old ones, so every change gets a new modification time.
+    """
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        h.update(path.encode("utf-8") + b"\0")
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        h.update(("%d:%r\0" % (st.st_size, st.st_mtime)).encode("ascii"))
+    return h.hexdigest()
+
+# values shared by many packages, like architectures and release names
+_interned_strings = dict()
+
+def intern_string(value):
+    """ Get a shared instance of a (unicode or byte) string """
+    if value is None:
+        return None
+    return _interned_strings.setdefault(value, value)
+
+class PackageInfo(object):
+    # we create one of these for every binary package, so keep them small
+    __slots__ = ('name', 'version', 'arch', 'source_package', 'upstream_version',
+                 'distro_release', 'url', 'cpt')
+
     def __init__(self, name, version, upstream_version, arch, distro_release):
         self.name = name
         self.version = version
-        self.arch = arch
+        self.arch = intern_string(arch)
         self.source_package = None
         self.upstream_version = upstream_version
-        self.distro_release = distro_release
+        self.distro_release = intern_string(distro_release)
 
         self.url = "#"
 
@@ -38,7 +80,62 @@ class PackageInfo():
         return yaml.dump(data, indent=2, default_flow_style=False, explicit_start=True)
 
     def __str__(self):
-        return "Package { name: %s | version: %s }" % (self.pkgname, self.version)
+        return "Package { name: %s | version: %s }" % (self.name, self.version)
+
+def _decode(value):
+    if not value:
+        return value
+    return value.decode("utf-8")
+
+class ComponentData(object):
+    """ The data of an AppStream component which we store in the database """
+
+    FIELDS = ('identifier', 'kind', 'name', 'summary', 'description', 'developer_name',
+              'license', 'homepage', 'icon_url', 'screenshots', 'provides')
+
+    def __init__(self, **kwargs):
+        for field in self.FIELDS:
+            setattr(self, field, kwargs.get(field))
+
+    @classmethod
+    def from_appstream(cls, cpt):
+        data = cls()
+        data.identifier = _decode(cpt.get_id())
+        data.kind = _decode(Appstream.ComponentKind.to_string(cpt.get_kind()))
+        data.name = _decode(cpt.get_name())
+        data.summary = _decode(cpt.get_summary())
+        data.description = _decode(cpt.get_description())
+        data.developer_name = _decode(cpt.get_developer_name())
+        data.license = _decode(cpt.get_project_license())
+        data.homepage = _decode(cpt.get_url(Appstream.UrlKind.HOMEPAGE))
+        data.icon_url = _decode(cpt.get_icon_url())
+
+        data.screenshots = list()
+        for shot in cpt.get_screenshots():
+            images = list()
+            for img in shot.get_images():
+                kind = Appstream.Image.kind_to_string(img.get_kind())
+                if not kind:
+                    continue
+                images.append({'kind': _decode(kind),
+                               'url': _decode(img.get_url()),
+                               'width': img.get_width(),
+                               'height': img.get_height()})
+            data.screenshots.append({'default': shot.get_kind() == Appstream.ScreenshotKind.DEFAULT,
+                                     'caption': _decode(shot.get_caption()),
+                                     'images': images})
+
+        data.provides = list()
+        for item_id in cpt.get_provided_items():
+            kind = Appstream.provides_item_get_kind(item_id)
+            value = Appstream.provides_item_get_value(item_id)
+            if not value:
+                continue
+            data.provides.append((_decode(Appstream.provides_kind_to_string(kind)), _decode(value)))
+        return data
+
+    def to_dict(self):
+        return dict([(field, getattr(self, field)) for field in self.FIELDS])
 
 class DistroDataRetriever():
     def __init__(self, distro_name):
@@ -63,13 +160,30 @@ class DistroDataRetriever():
     def get_name(self):
         return self._distro_name
 
+    def get_cache_update_tasks(self):
+        """ Get (description, function) pairs of independent jobs which update the caches """
+        return list()
+
     def update_caches(self):
         """ Update the cached AppStream and package information """
-        pass
+        for description, task in self.get_cache_update_tasks():
+            task()
+
+    def get_components_packages(self, releases=None):
+        """ Iterate over packages which have AppStream components, optionally only for the given release codenames """
+        return iter(())
 
-    def get_components_packages(self):
+    def _get_release_input_files(self, codename):
+        """ Get the cache files the packages and components of a release are read from """
         return list()
 
+    def get_release_fingerprint(self, codename):
+        """ Get a checksum over all input data of a release, or None if it can not be determined """
+        paths = self._get_release_input_files(codename)
+        if not paths:
+            return None
+        return hash_files(paths)
+
     def get_releases(self):
         """ Get releases of this distribution """
         releases = list()
@@ -80,7 +194,7 @@ class DistroDataRetriever():
     def get_metadata_path(self):
         return os.path.join(self.get_cache_path(), "metadata")
 
-    def get_appstream_components(self, metadata_path):
+    def _load_appstream_components(self, metadata_path):
         dpool = Appstream.DataPool.new()
         dpool.set_data_source_directories([metadata_path])
         dpool.set_locale("C")
@@ -91,13 +205,42 @@ class DistroDataRetriever():
         res = dict()
         cpts = dpool.get_components()
         for cpt in cpts:
-            identifier = cpt.get_id().decode("utf-8")
-
             # we can only have one package name per component
             pkgname = cpt.get_pkgnames()[0]
             if pkgname:
                 pkgname = pkgname.decode("utf-8")
             else:
                 continue
-            res[pkgname] = cpt
+            res[pkgname] = ComponentData.from_appstream(cpt)
+        return res
+
+    def get_appstream_components(self, metadata_path):
+        """ Get a pkgname->ComponentData map of the AppStream data in metadata_path
+
+        Parsing AppStream data is expensive, so the result is cached on disk
+        together with a checksum of the file listing it was created from.
+        """
+        checksum = hash_files(list_files(metadata_path))
+        snapshot_dir = os.path.join(self.get_cache_path(), "components")
+        snapshot_path = os.path.join(snapshot_dir, "%s.pickle" % (os.path.basename(os.path.normpath(metadata_path))))
+        try:
+            with open(snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot['checksum'] == checksum:
+                res = dict()
+                for pkgname, data in snapshot['components'].items():
+                    res[pkgname] = ComponentData(**data)
+                return res
+        except (IOError, EOFError, KeyError, pickle.UnpicklingError):
+            pass
+
+        res = self._load_appstream_components(metadata_path)
+
+        if not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        snapshot = {'checksum': checksum,
+                    'components': dict([(pkgname, data.to_dict()) for pkgname, data in res.items()])}
+        with open(snapshot_path + ".tmp", 'wb') as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(snapshot_path + ".tmp", snapshot_path)
         return res
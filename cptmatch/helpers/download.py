@@ -0,0 +1,98 @@
+import os
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# size of the blocks downloads are streamed to disk with
+CHUNK_SIZE = 512 * 1024
+# number of connections kept open per host
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """ Get the HTTP session shared by all fetchers, which keeps connections alive between requests """
+    global _session
+    with _session_lock:
+        if not _session:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+def _write_response(r, dest):
+    # write to a temporary file first, so we never leave a partial file at dest
+    tmp_dest = dest + ".tmp"
+    try:
+        with open(tmp_dest, "wb") as f:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+        os.rename(tmp_dest, dest)
+    except:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+        raise
+
+def fetch(url):
+    """ Get the content of a (small) resource """
+    r = get_session().get(url)
+    r.raise_for_status()
+    return r.content
+
+def download_file(url, dest):
+    """ Download url to dest, without ever holding the whole file in memory """
+    r = get_session().get(url, stream=True)
+    try:
+        r.raise_for_status()
+        _write_response(r, dest)
+    except:
+        r.close()
+        raise
+
+def _load_validators(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return dict()
+
+def download_if_modified(url, dest):
+    """ Download url to dest, unless the copy we have is still current.
+
+    The HTTP cache validators of the last download are stored next to the
+    downloaded file and sent with the next request.
+    Returns True if dest was (re)downloaded, False if it was unchanged.
+    """
+    validators_path = dest + ".validators"
+    headers = dict()
+    if os.path.isfile(dest):
+        validators = _load_validators(validators_path)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    r = get_session().get(url, headers=headers, stream=True)
+    if r.status_code == 304:
+        # consume the (empty) body, so the connection goes back to the pool
+        r.content
+        return False
+    try:
+        r.raise_for_status()
+        _write_response(r, dest)
+    except:
+        r.close()
+        raise
+
+    validators = dict()
+    if r.headers.get('ETag'):
+        validators['etag'] = r.headers['ETag']
+    if r.headers.get('Last-Modified'):
+        validators['last_modified'] = r.headers['Last-Modified']
+    with open(validators_path, 'w') as f:
+        json.dump(validators, f)
+    return True
@@ -0,0 +1,61 @@
+import struct
+from distro import PackageInfo
+
+# Compact on-disk format for the package lists of a distribution:
+# a header, followed by one length-prefixed record per package, whose
+# fields are UTF-8 encoded and separated by NUL bytes.
+MAGIC = b"FIGMENT-PKGCACHE-1\n"
+FIELDS = ('name', 'version', 'upstream_version', 'arch', 'distro_release', 'url', 'source_package')
+
+_length = struct.Struct("!I")
+
+class PackageCacheError(Exception):
+    pass
+
+def _encode(value):
+    if value is None:
+        return b""
+    if isinstance(value, bytes):
+        return value
+    return value.encode("utf-8")
+
+class PackageCacheWriter(object):
+    def __init__(self, fileobj):
+        self._f = fileobj
+        self._f.write(MAGIC)
+
+    def write(self, pkg):
+        record = b"\0".join([_encode(getattr(pkg, field)) for field in FIELDS])
+        self._f.write(_length.pack(len(record)))
+        self._f.write(record)
+
+    def close(self):
+        self._f.close()
+
+class PackageCacheReader(object):
+    def __init__(self, fileobj):
+        self._f = fileobj
+        if self._f.read(len(MAGIC)) != MAGIC:
+            raise PackageCacheError("Not a package cache file: %s" % (getattr(fileobj, 'name', fileobj)))
+
+    def __iter__(self):
+        read = self._f.read
+        while True:
+            header = read(_length.size)
+            if not header:
+                break
+            (size,) = _length.unpack(header)
+            record = read(size)
+            if len(record) != size:
+                raise PackageCacheError("Truncated package cache record")
+            values = [value.decode("utf-8") for value in record.split(b"\0")]
+            if len(values) != len(FIELDS):
+                raise PackageCacheError("Invalid package cache record")
+            name, version, upstream_version, arch, distro_release, url, source_package = values
+            pkg = PackageInfo(name, version, upstream_version, arch, distro_release or None)
+            pkg.url = url
+            pkg.source_package = source_package or None
+            yield pkg
+
+    def close(self):
+        self._f.close()
@@ -50,10 +50,13 @@ import shutil
 import tempfile
 import urlparse
 import urllib2
+import requests
 
 from posixpath import join as posixjoin # Handy for URLs
 
 from distro import PackageInfo
+from download import download_file
+from pkgcache import PackageCacheWriter
 
 try:
     from lxml import etree as ET
@@ -112,7 +115,7 @@ class Yast2Exception(Exception):
 
 
 class DistOutput(object):
-    def __init__(self, outdir, tag, style):
+    def __init__(self, outdir, tag, style, yaml_export=False):
         d = os.path.join(outdir, "dist-" + tag)
         try:
             os.makedirs(d)
@@ -121,17 +124,32 @@ class DistOutput(object):
                 raise e
 
         self.fn_style = os.path.join(d, "style")
-        self.fn_pkgs = os.path.join(d, "packages.gz")
+        self.fn_cache = os.path.join(d, "packages.bin")
         self.of_style = open(self.fn_style + ".tmp", "w")
-        self.of_pkgs = gzip.GzipFile(self.fn_pkgs + ".tmp", "w")
+        self.of_cache = PackageCacheWriter(open(self.fn_cache + ".tmp", "wb"))
+
+        # YAML is much slower to read and write, only export it on request
+        self.fn_pkgs = None
+        self.of_pkgs = None
+        if yaml_export:
+            self.fn_pkgs = os.path.join(d, "packages.gz")
+            self.of_pkgs = gzip.GzipFile(self.fn_pkgs + ".tmp", "w")
 
         print >>self.of_style, style
 
+    def write_package(self, package):
+        self.of_cache.write(package)
+        if self.of_pkgs:
+            self.of_pkgs.write(package.to_yaml())
+
     def close(self):
         self.of_style.close()
-        self.of_pkgs.close()
+        self.of_cache.close()
         os.rename(self.fn_style + ".tmp", self.fn_style)
-        os.rename(self.fn_pkgs + ".tmp", self.fn_pkgs)
+        os.rename(self.fn_cache + ".tmp", self.fn_cache)
+        if self.of_pkgs:
+            self.of_pkgs.close()
+            os.rename(self.fn_pkgs + ".tmp", self.fn_pkgs)
 
 
 class Metadata(object):
@@ -191,24 +209,7 @@ class Metadata(object):
                 shutil.copy(old_cache, cache)
                 return
 
-        fout = open(cache, 'w')
-        fin = None
-        try:
-            fin = urllib2.urlopen(posixjoin(self.resource, subpath))
-            while True:
-                bytes = fin.read(500 * 1024)
-                if len(bytes) == 0:
-                    break
-                fout.write(bytes)
-            fout.close()
-        except urllib2.HTTPError, e:
-            if fin:
-                fin.close()
-            fout.close()
-            os.unlink(cache)
-            raise e
-        fin.close()
-        fout.close()
+        download_file(posixjoin(self.resource, subpath), cache)
 
     def _get_local_path(self, subpath, fetch = True, expected_hash_type = None, expected_hash = None):
         if self._is_local:
@@ -246,15 +247,15 @@ class Metadata(object):
 
         pkg.url = url
 
-    def export_data(self, tag, style, outdir='.'):
+    def export_data(self, tag, style, outdir='.', yaml_export=False):
         log.info("Exporting data.")
-        of = DistOutput(outdir, tag, style)
+        of = DistOutput(outdir, tag, style, yaml_export)
         # It's always much more readable to sort the output
         self.packages.sort(key=operator.attrgetter('name'))
         for package in self.packages:
             # Output package data
             self._set_url_for_package(tag, style, package)
-            of.of_pkgs.write(package.to_yaml())
+            of.write_package(package)
 
         of.close()
         log.info("Done exporting data.")
@@ -280,7 +281,7 @@ class RpmMd(Metadata):
     def _fetch(self, subpath, expected_hash_type = None, expected_hash = None):
         try:
             Metadata._fetch(self, subpath, expected_hash_type, expected_hash)
-        except urllib2.HTTPError, e:
+        except requests.RequestException, e:
             raise RpmMdException('Cannot fetch %s from %s: %s' % (subpath, self.resource, e))
 
     def fetch_and_parse(self):
@@ -352,19 +353,28 @@ class RpmMd(Metadata):
         if not os.path.exists(primary_path):
             raise RpmMdException('%s in %s does not exist.' % (self._primary_filename, self.resource))
 
-        try:
-            root = ET.parse(gzip.open(primary_path)).getroot()
-        except SyntaxError, e:
-            raise RpmMdException('Cannot parse primary metadata: %s' % (e,))
-
-        for package_node in root.findall(RPM_MD_NS + 'package'):
-            (pkgid, package) = self._parse_package_node(package_node)
+        for (pkgid, package) in self._iter_primary_packages(primary_path):
             self._pkgs_by_id[pkgid] = package
             self._append_package(package)
 
         self._parsed_primary = True
         log.info("Done parsing primary xml.")
 
+    def _iter_primary_packages(self, primary_path):
+        """ Yield (pkgid, package) for every package in primary.xml, without building the whole tree """
+        root = None
+        try:
+            for event, node in ET.iterparse(gzip.open(primary_path), events=('start', 'end')):
+                if root is None:
+                    root = node
+                if event != 'end' or node.tag != RPM_MD_NS + 'package':
+                    continue
+                yield self._parse_package_node(node)
+                # drop the parsed package, so memory usage stays constant
+                root.clear()
+        except SyntaxError, e:
+            raise RpmMdException('Cannot parse primary metadata: %s' % (e,))
+
     def _parse_package_node(self, package_node):
         name = None
         arch = None
@@ -430,7 +440,7 @@ class Yast2(Metadata):
     def _fetch(self, subpath, expected_hash_type = None, expected_hash = None):
         try:
             Metadata._fetch(self, subpath, expected_hash_type, expected_hash)
-        except urllib2.HTTPError, e:
+        except requests.RequestException, e:
             raise Yast2Exception('Cannot fetch %s from %s: %s' % (subpath, self.resource, e))
 
     def fetch_and_parse(self):
@@ -623,6 +633,7 @@ def main(args):
     parser.add_option("--metadata-type", default="auto", help="Metadata type (%s). Default: %%default" % ', '.join(KNOWN_METADATA_TYPE))
     parser.add_option("--outdir", default=".", help="Destination directory. Default: %default")
     parser.add_option("--cachedir", default="./cache", help="Cache directory. Default: %default")
+    parser.add_option("--yaml", action="store_true", help="Also export the package data as YAML")
     parser.add_option("--verbose", action="store_true", help="Verbose output")
 
     (opts, args) = parser.parse_args()
@@ -686,7 +697,7 @@ def main(args):
         print >>sys.stderr, '%s' % e
         sys.exit(2)
 
-    metadata.export_data(distro_tag, distro_style, outdir=opts.outdir)
+    metadata.export_data(distro_tag, distro_style, outdir=opts.outdir, yaml_export=opts.yaml)
 
     metadata.cleanup(keep_cache=True)
 
@@ -0,0 +1,78 @@
+"""
+Version comparison following the rules of dpkg.
+
+Versions are turned into sort keys: plain ASCII strings which compare
+like the versions they were made from, with an ordinary string
+comparison. This makes comparisons cheap, and allows storing the keys in
+the database to order versions in SQL.
+
+Components and their versions are shared between all distributions, so
+all keys use the same rules, also for versions coming from RPM-based
+distributions. The two only disagree on a few unusual versions, e.g.
+dpkg sorts 1.0.a after 1.0.1, and rpm before it.
+"""
+
+# markers used in the keys, in the order they sort in: '~', end of the
+# version part, end of a non-digit part, letters, other characters
+_TILDE = '('
+_TERM = ')'
+_END = '*'
+_LETTER = '+'
+_OTHER = ','
+
+# the key cache is simply dropped once it grows too large
+MAX_CACHE_SIZE = 100000
+
+def _number_key(digits):
+    digits = digits.lstrip('0')
+    # the length goes first, so longer numbers sort after shorter ones
+    return chr(ord('0') + min(len(digits), 75)) + digits
+
+def _split_evr(version):
+    epoch = "0"
+    if ":" in version:
+        epoch, version = version.split(":", 1)
+    release = ""
+    if "-" in version:
+        version, release = version.rsplit("-", 1)
+    return (epoch, version, release)
+
+def _dpkg_part_key(part):
+    """ Key of an upstream version or revision, ordered like dpkg's verrevcmp() """
+    key = list()
+    i = 0
+    while i < len(part):
+        # non-digit prefix: '~' sorts before anything, even the end of the part, letters before other characters
+        while i < len(part) and not part[i].isdigit():
+            c = part[i]
+            if c == '~':
+                key.append(_TILDE)
+            elif c.isalpha():
+                key.append(_LETTER + c)
+            else:
+                key.append(_OTHER + c)
+            i += 1
+        key.append(_END)
+
+        start = i
+        while i < len(part) and part[i].isdigit():
+            i += 1
+        key.append(_number_key(part[start:i]))
+    key.append(_TERM)
+    return "".join(key)
+
+def _dpkg_key(version):
+    epoch, upstream, revision = _split_evr(version)
+    return _number_key(epoch) + _dpkg_part_key(upstream) + _dpkg_part_key(revision)
+
+_key_cache = dict()
+
+def version_key(version):
+    """ Get the sort key of a version """
+    key = _key_cache.get(version)
+    if key is None:
+        if len(_key_cache) >= MAX_CACHE_SIZE:
+            _key_cache.clear()
+        key = _dpkg_key(version)
+        _key_cache[version] = key
+    return key
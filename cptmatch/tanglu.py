@@ -1,10 +1,14 @@
 
 from helpers.distro import *
+from helpers.download import download_if_modified
 import gzip
 import re
 from apt_pkg import TagFile, version_compare, init
-import requests
+import errno
 import os
+from functools import partial
+from itertools import izip
+from multiprocessing import Pool, cpu_count
 
 def package_list_to_dict(pkg_list):
     pkg_dict = dict()
@@ -18,6 +22,24 @@ def package_list_to_dict(pkg_list):
         pkg_dict[pkg.pkgname] = pkg
     return pkg_dict
 
+def _parse_packages_index(job):
+    """ Get the (name, version) pairs of the packages in an index we are interested in (runs in a worker process) """
+    index_path, pkgnames = job
+    res = list()
+    f = gzip.open(index_path, 'rb')
+    tagf = TagFile(f)
+    for section in tagf:
+        pkgversion = section.get('Version')
+        if not pkgversion:
+            print("Tanglu: Bad package data found!")
+            continue
+        pkgname = section['Package']
+        if pkgname not in pkgnames:
+            continue
+        res.append((pkgname, pkgversion))
+    f.close()
+    return res
+
 class TangluDataRetriever(DistroDataRetriever):
     def __init__(self):
         DistroDataRetriever.__init__(self, "Tanglu")
@@ -30,17 +52,23 @@ class TangluDataRetriever(DistroDataRetriever):
             releases.append({'codename': suite['name'], 'version': suite['version']})
         return releases
 
-    def update_caches(self):
-        cache_dir = self.get_cache_path()
+    def _update_index_cache(self, suite_name, component):
+        url = "%s/tanglu/dists/%s/%s/binary-amd64/Packages.gz" % (self.config['archive_url'], suite_name, component)
+        save_dir = os.path.join(self.get_cache_path(), suite_name, component)
+        try:
+            os.makedirs(save_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise e
+        download_if_modified(url, os.path.join(save_dir, "Packages-amd64.gz"))
+
+    def get_cache_update_tasks(self):
+        tasks = list()
         for suite in self.config['suites']:
-            for component in ["main", "contrib", "non-free"]:
-                url = "%s/tanglu/dists/%s/%s/binary-amd64/Packages.gz" % (self.config['archive_url'], suite['name'], component)
-                save_dir = os.path.join(cache_dir, suite['name'], component)
-                if not os.path.exists(save_dir):
-                    os.makedirs(save_dir)
-                r = requests.get(url)
-                with open(os.path.join(save_dir, "Packages-amd64.gz"), "wb") as code:
-                    code.write(r.content)
+            for component in self._archive_components:
+                tasks.append(("%s/%s" % (suite['name'], component),
+                              partial(self._update_index_cache, suite['name'], component)))
+        return tasks
 
     def _get_upstream_version (self, version):
         v = no_epoch(version)
@@ -48,41 +76,54 @@ class TangluDataRetriever(DistroDataRetriever):
             v = v[:v.index("-")]
         return v
 
-    def get_components_packages(self):
-        pkgs = list()
+    def _get_release_input_files(self, codename):
+        paths = list_files(os.path.join(self.get_metadata_path(), codename))
+        for archive_component in self._archive_components:
+            paths.append(os.path.join(self.get_cache_path(), codename, archive_component, "Packages-amd64.gz"))
+        return paths
+
+    def get_components_packages(self, releases=None):
+        # the package indexes are independent, so we parse them in parallel
+        jobs = list()
+        suite_cpts = dict()
         for suite in self.config['suites']:
             suite_name = suite['name']
+            if releases is not None and suite_name not in releases:
+                continue
             metadatadir = os.path.join(self.get_metadata_path(), suite_name)
 
             # get list of AppStream components for the given distro
             ascpts = self.get_appstream_components(metadatadir)
+            suite_cpts[suite_name] = ascpts
 
             for archive_component in self._archive_components:
                 index_path = os.path.join(self.get_cache_path(), suite_name, archive_component, "Packages-amd64.gz")
+                jobs.append((suite_name, (index_path, set(ascpts.keys()))))
+        if not jobs:
+            return
 
-                f = gzip.open(index_path, 'rb')
-                tagf = TagFile(f)
-                for section in tagf:
-                    pkgversion = section.get('Version')
-                    if not pkgversion:
-                        print("Tanglu: Bad package data found!")
-                    pkgname = section['Package']
-                    cpt = ascpts.get(pkgname)
-                    if not cpt:
-                        continue
+        # yield the packages of each index as soon as it is parsed, while the workers continue
+        pool = Pool(min(len(jobs), cpu_count()))
+        try:
+            results = pool.imap(_parse_packages_index, [job for suite_name, job in jobs])
+            for (suite_name, job), index_pkgs in izip(jobs, results):
+                ascpts = suite_cpts[suite_name]
+                for pkgname, pkgversion in index_pkgs:
                     pkg = PackageInfo(pkgname,
                               pkgversion,
                               self._get_upstream_version(pkgversion),
                               "unknown-amd64",
                               suite_name)
                     pkg.url = "http://packages.tanglu.org/%s/%s" % (suite_name, pkgname)
-                    pkg.cpt = cpt
-                    pkgs.append(pkg)
-        return pkgs
+                    pkg.cpt = ascpts[pkgname]
+                    yield pkg
+        finally:
+            pool.terminate()
+            pool.join()
 
 ### apt_pkg needs to be initialized
 init()
 
 if __name__ == '__main__':
     test = TangluDataRetriever()
-    print(test.get_components_packages())
+    print(list(test.get_components_packages()))
@@ -1,143 +1,460 @@
 
 from figment.database import db
 from figment.models import *
-from gi.repository import Appstream
-from distutils.version import LooseVersion
+from figment.search import create_search_index, rebuild_search_index
+from sqlalchemy import inspect, bindparam
 from figment import app
+from multiprocessing.pool import ThreadPool
 import shutil
+import hashlib
+import re
+from datetime import datetime
+import json
 import os
 
 #from debian import *
 from fedora import *
 from tanglu import *
+from helpers.version import version_key
+
+# SQLite can not bind more than 999 parameters per statement
+IN_QUERY_CHUNK_SIZE = 500
+# number of packages written to the database at once
+IMPORT_BATCH_SIZE = 2000
+# names of icons in the icon cache: the SHA-1 of their content, and their extension
+ICON_NAME_RE = re.compile(r"^[0-9a-f]{40}(\.\w+)?$")
+
+def _batches(iterable, size):
+    batch = list()
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
 
 class DatabaseUpdater:
     def __init__(self):
         self.icon_cache_path = os.path.join(app.root_path, "..", "static", "images", "cpt-icons")
+        # the icon cache is usually a symlink into the cache directory
+        if not os.path.isdir(self.icon_cache_path):
+            os.makedirs(os.path.realpath(self.icon_cache_path))
+        # (path, size, mtime) -> name of icons already in the icon cache
+        self._icon_names = dict()
+        self.workers = app.config.get('UPDATE_WORKERS', 4)
 
     def init_database(self):
         db.create_all()
+        self._upgrade_schema()
+        create_search_index()
         db.session.commit()
 
-    def update_components_packages(self, distro):
-        distro_name = distro.get_name()
-        print("Adding data for: %s" % (distro_name))
-
-        for pkg in distro.get_components_packages():
-            cpt = pkg.cpt
-            pkgname = pkg.name
-            identifier = cpt.get_id().decode("utf-8")
-            dbcpt = db.session.query(Component).filter_by(identifier=identifier).first()
-            if not dbcpt:
-               dbcpt = Component()
-               dbcpt.identifier = identifier
-               db.session.add(dbcpt)
-               db.session.flush()
-
-            # only update if we have new data
-            if (not dbcpt.highest_version) or (pkg.upstream_version > LooseVersion(dbcpt.highest_version)):
-                dbcpt.kind = Appstream.ComponentKind.to_string(cpt.get_kind()).decode("utf-8")
-                dbcpt.identifier = identifier
-                dbcpt.name = cpt.get_name().decode("utf-8")
-                dbcpt.summary = cpt.get_summary().decode("utf-8")
-                developer_name = cpt.get_developer_name()
-                if developer_name:
-                    developer_name = developer_name.decode("utf-8")
-                dbcpt.developer_name = developer_name
-
-                dbcpt.highest_version = str(pkg.upstream_version)
-
-                screenshots = cpt.get_screenshots()
-                dbcpt.screenshots = list()
-                for shot in screenshots:
-                    dbshot = Screenshot()
-                    dbshot.default = shot.get_kind() == Appstream.ScreenshotKind.DEFAULT
-                    dbshot.caption = shot.get_caption().decode("utf-8")
-                    imgdata = list()
-                    for img in shot.get_images():
-                        d = dict()
-                        d['kind'] = Appstream.Image.kind_to_string(img.get_kind())
-                        if not d['kind']:
-                            continue
-                        d['kind'] = d['kind'].decode("utf-8")
-                        d['url'] = img.get_url().decode("utf-8")
-                        d['width'] = img.get_width()
-                        d['height'] = img.get_height()
-                        imgdata.append(d)
-                    if imgdata:
-                        dbshot.set_image_data(imgdata)
-                        dbcpt.screenshots.append(dbshot)
-
-                cptdesc = cpt.get_description().decode("utf-8").replace('\n', "<br/>")
-                dbcpt.description = cptdesc
-
-                license = cpt.get_project_license()
-                if license:
-                    license = license.decode("utf-8")
-                dbcpt.license = license
-                homepage = cpt.get_url(Appstream.UrlKind.HOMEPAGE)
-                if homepage:
-                    homepage = homepage.decode("utf-8")
-                else:
-                    homepage = "#"
-                dbcpt.homepage = homepage
-
-                icon_url = cpt.get_icon_url().decode("utf-8")
-                # remove old icon
-                if dbcpt.icon_url:
-                    icon_dest = os.path.join(self.icon_cache_path, dbcpt.icon_url)
-                    if os.path.isfile(dbcpt.icon_url):
-                        os.remove(dbcpt.icon_url)
-
-                dbcpt.icon_url = os.path.basename(icon_url)
-                icon_dest = os.path.join(self.icon_cache_path, dbcpt.icon_url)
-                try:
-                    shutil.copyfile(icon_url, icon_dest)
-                except:
-                    dbcpt.icon_url = ""
-
-            dbdistro = db.session.query(Distribution).filter_by(codename=pkg.distro_release, name=distro_name).first()
-            if not dbdistro:
-               continue
-            ver = db.session.query(ComponentVersion).filter_by(component_id=dbcpt.id, version=pkg.upstream_version).first()
-
-            if not ver:
-                ver = ComponentVersion()
-                db.session.add(ver)
-                dbcpt.versions.append(ver)
-                ver.version = pkg.upstream_version
-                db.session.flush()
-            ver.version = pkg.upstream_version
-
-            dpk = db.session.query(DistroPackage).filter_by(version_id=ver.id, distro_id=dbdistro.id).first()
-            if not dpk:
-                dpk = DistroPackage()
-                ver.packages.append(dpk)
-                dbdistro.packages.append(dpk)
-                dpk.pkgname = pkg.name
-                dpk.package_url = pkg.url
-                db.session.add(dpk)
-                db.session.flush()
+    def _upgrade_schema(self):
+        """ Bring databases created by older versions of Figment up to date """
+        inspector = inspect(db.engine)
+        columns_added = False
+        for table in db.metadata.sorted_tables:
+            # create_all() only creates new tables, not new columns
+            existing = set([column['name'] for column in inspector.get_columns(table.name)])
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                print("Adding column: %s.%s" % (table.name, column.name))
+                preparer = db.engine.dialect.identifier_preparer
+                db.engine.execute("ALTER TABLE %s ADD COLUMN %s %s" % (preparer.format_table(table),
+                                                                      preparer.format_column(column),
+                                                                      column.type.compile(dialect=db.engine.dialect)))
+                columns_added = True
 
-            for item_id in cpt.get_provided_items():
-                kind = Appstream.provides_item_get_kind(item_id)
-                kind_str = Appstream.provides_kind_to_string(kind).decode("utf-8")
-                value = Appstream.provides_item_get_value(item_id)
-                if not value:
+            # ...and only creates indexes together with new tables
+            existing = set([index['name'] for index in inspector.get_indexes(table.name)])
+            for index in table.indexes:
+                if index.name in existing:
                     continue
-                value = value.decode("utf-8")
+                print("Creating index: %s" % (index.name))
+                index.create(db.engine)
+
+        # new columns need to be filled, so the next import must not skip anything
+        if columns_added:
+            db.engine.execute(Distribution.__table__.update().values(fingerprint=None))
+
+        # versions which are already known are not imported again
+        missing = db.session.query(ComponentVersion.id, ComponentVersion.version) \
+                    .filter(ComponentVersion.version_key == None).all()
+        if missing:
+            table = ComponentVersion.__table__
+            db.session.execute(table.update().where(table.c.id == bindparam('ver_id')) \
+                                    .values(version_key=bindparam('key')),
+                               [{'ver_id': ver_id, 'key': version_key(version)} for ver_id, version in missing])
+
+        # ...and neither are screenshots of components which didn't change
+        missing = db.session.query(Screenshot.id, Screenshot.images).filter(Screenshot.url_thumb == None).all()
+        if missing:
+            rows = list()
+            for shot_id, images in missing:
+                url_thumb, url_large = Screenshot.pick_image_urls(json.loads(images or "[]"))
+                rows.append({'shot_id': shot_id, 'thumb': url_thumb, 'large': url_large})
+            table = Screenshot.__table__
+            db.session.execute(table.update().where(table.c.id == bindparam('shot_id')) \
+                                    .values(url_thumb=bindparam('thumb'), url_large=bindparam('large')),
+                               rows)
+
+    def _query_in(self, query, column, values):
+        """ Run query for all rows where column is in values, in chunks small enough for the database """
+        values = list(values)
+        res = list()
+        for i in range(0, len(values), IN_QUERY_CHUNK_SIZE):
+            res.extend(query.filter(column.in_(values[i:i+IN_QUERY_CHUNK_SIZE])).all())
+        return res
+
+    def _insert_rows(self, table, rows):
+        if rows:
+            db.session.execute(table.insert(), rows)
+
+    def _delete_rows(self, table, column, values):
+        values = list(values)
+        for i in range(0, len(values), IN_QUERY_CHUNK_SIZE):
+            db.session.execute(table.delete().where(column.in_(values[i:i+IN_QUERY_CHUNK_SIZE])))
+
+    def _get_screenshot_rows(self, dbcpt, cpt):
+        rows = list()
+        for shot in cpt.screenshots:
+            if shot['images']:
+                url_thumb, url_large = Screenshot.pick_image_urls(shot['images'])
+                rows.append({'component_id': dbcpt.id,
+                             'default': shot['default'],
+                             'caption': shot['caption'],
+                             'images': json.dumps(shot['images']),
+                             'url_thumb': url_thumb,
+                             'url_large': url_large})
+        return rows
+
+    def _update_component_data(self, dbcpt, cpt, pkg):
+        dbcpt.kind = cpt.kind
+        dbcpt.name = cpt.name
+        dbcpt.summary = cpt.summary
+        dbcpt.developer_name = cpt.developer_name
+
+        dbcpt.highest_version = str(pkg.upstream_version)
+        dbcpt.highest_version_key = version_key(dbcpt.highest_version)
+
+        cptdesc = (cpt.description or "").replace('\n', "<br/>")
+        dbcpt.description = cptdesc
+
+        dbcpt.license = cpt.license
+        homepage = cpt.homepage
+        if not homepage:
+            homepage = "#"
+        dbcpt.homepage = homepage
+
+        # icons which are no longer used are removed by _remove_unused_icons() after the import
+        try:
+            dbcpt.icon_url = self._store_icon(cpt.icon_url)
+        except (IOError, OSError, TypeError):
+            dbcpt.icon_url = ""
+
+    def _store_icon(self, icon_path):
+        """ Add an icon to the icon cache, named after its content, and return the name """
+        st = os.stat(icon_path)
+        # many components share icons, and most are stored again with every import
+        memo_key = (icon_path, st.st_size, st.st_mtime)
+        name = self._icon_names.get(memo_key)
+        if name:
+            return name
+
+        sha1 = hashlib.sha1()
+        with open(icon_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                sha1.update(chunk)
+        # icons never change their name, so the web frontend can let clients cache them forever
+        name = sha1.hexdigest() + os.path.splitext(icon_path)[1]
+        icon_dest = os.path.join(self.icon_cache_path, name)
+        if not os.path.isfile(icon_dest):
+            tmp_dest = icon_dest + ".tmp"
+            if os.path.lexists(tmp_dest):
+                os.remove(tmp_dest)
+            # the metadata is extracted into new files, so a hardlink never changes under our feet
+            try:
+                os.link(icon_path, tmp_dest)
+            except OSError:
+                shutil.copyfile(icon_path, tmp_dest)
+            os.rename(tmp_dest, icon_dest)
+        self._icon_names[memo_key] = name
+        return name
+
+    def _import_packages(self, distro_name, pkgs, known_dpkgs=None):
+        """ Write the data of a list of packages into the database, using a fixed number of queries per table.
+
+        known_dpkgs is a set of the (version id, distro id) pairs we already have
+        distro packages for, if the caller knows them. Returns a map of the
+        (version id, distro id) pairs of all given packages to their
+        pkgname->package url maps.
+        """
+        dbdistros = dict()
+        for dbdistro in db.session.query(Distribution).filter_by(name=distro_name):
+            dbdistros[dbdistro.codename] = dbdistro
+
+        # find the newest package for each component
+        pkgs = [(pkg.cpt.identifier, pkg) for pkg in pkgs]
+        newest_pkgs = dict()
+        for identifier, pkg in pkgs:
+            newest = newest_pkgs.get(identifier)
+            if (not newest) or (version_key(pkg.upstream_version) > version_key(newest.upstream_version)):
+                newest_pkgs[identifier] = pkg
+
+        # resolve components, adding the ones we don't know yet
+        dbcpts = dict()
+        for dbcpt in self._query_in(db.session.query(Component), Component.identifier, newest_pkgs.keys()):
+            dbcpts[dbcpt.identifier] = dbcpt
+        new_identifiers = [identifier for identifier in newest_pkgs.keys() if identifier not in dbcpts]
+        self._insert_rows(Component.__table__, [{'identifier': identifier} for identifier in new_identifiers])
+        for dbcpt in self._query_in(db.session.query(Component), Component.identifier, new_identifiers):
+            dbcpts[dbcpt.identifier] = dbcpt
+
+        # only update components if we have new data
+        updated_cpt_ids = list()
+        screenshot_rows = list()
+        for identifier, pkg in newest_pkgs.items():
+            dbcpt = dbcpts[identifier]
+            highest_key = dbcpt.highest_version_key
+            if dbcpt.highest_version and not highest_key:
+                highest_key = version_key(dbcpt.highest_version)
+            # the data of the highest version is refreshed too, its AppStream data may have changed
+            if highest_key and (version_key(pkg.upstream_version) < highest_key):
+                continue
+            self._update_component_data(dbcpt, pkg.cpt, pkg)
+            updated_cpt_ids.append(dbcpt.id)
+            screenshot_rows.extend(self._get_screenshot_rows(dbcpt, pkg.cpt))
+        self._delete_rows(Screenshot.__table__, Screenshot.component_id, updated_cpt_ids)
+        self._insert_rows(Screenshot.__table__, screenshot_rows)
+
+        # we can only add packages for releases we know
+        pkgs = [(dbcpts[identifier].id, pkg) for identifier, pkg in pkgs if pkg.distro_release in dbdistros]
+        cpt_ids = set([cpt_id for cpt_id, pkg in pkgs])
 
-                pitem = db.session.query(ProvidedItem).filter_by(version_id=ver.id, kind=kind_str, value=value).first()
+        # resolve component versions
+        versions = dict()
+        ver_q = db.session.query(ComponentVersion.id, ComponentVersion.component_id, ComponentVersion.version)
+        for ver_id, cpt_id, version in self._query_in(ver_q, ComponentVersion.component_id, cpt_ids):
+            versions[(cpt_id, version)] = ver_id
+        new_versions = set()
+        for cpt_id, pkg in pkgs:
+            key = (cpt_id, pkg.upstream_version)
+            if key not in versions:
+                new_versions.add(key)
+        self._insert_rows(ComponentVersion.__table__,
+                          [{'component_id': cpt_id, 'version': version, 'version_key': version_key(version)}
+                           for cpt_id, version in new_versions])
+        if new_versions:
+            new_cpt_ids = set([cpt_id for cpt_id, version in new_versions])
+            for ver_id, cpt_id, version in self._query_in(ver_q, ComponentVersion.component_id, new_cpt_ids):
+                versions[(cpt_id, version)] = ver_id
+
+        # resolve distro packages and provided items of all versions
+        ver_ids = set([versions[(cpt_id, pkg.upstream_version)] for cpt_id, pkg in pkgs])
+        if known_dpkgs is None:
+            dpkg_q = db.session.query(DistroPackage.version_id, DistroPackage.distro_id)
+            known_dpkgs = set(self._query_in(dpkg_q, DistroPackage.version_id, ver_ids))
+        pitem_q = db.session.query(ProvidedItem.version_id, ProvidedItem.kind, ProvidedItem.value)
+        known_pitems = set(self._query_in(pitem_q, ProvidedItem.version_id, ver_ids))
+
+        dpkg_rows = list()
+        pitem_rows = list()
+        pkg_keys = dict()
+        for cpt_id, pkg in pkgs:
+            ver_id = versions[(cpt_id, pkg.upstream_version)]
+            distro_id = dbdistros[pkg.distro_release].id
+            # a release may ship a version in several binary packages, we store the first one
+            pkg_keys.setdefault((ver_id, distro_id), dict())[pkg.name] = pkg.url
+            if (ver_id, distro_id) not in known_dpkgs:
+                known_dpkgs.add((ver_id, distro_id))
+                dpkg_rows.append({'version_id': ver_id,
+                                  'distro_id': distro_id,
+                                  'pkgname': pkg.name,
+                                  'package_url': pkg.url})
+            for kind_str, value in pkg.cpt.provides:
                 # in case this item already exists, we move on
-                if pitem:
+                if (ver_id, kind_str, value) in known_pitems:
                     continue
-                pitem = ProvidedItem()
+                known_pitems.add((ver_id, kind_str, value))
+                pitem_rows.append({'version_id': ver_id, 'kind': kind_str, 'value': value})
+        self._insert_rows(DistroPackage.__table__, dpkg_rows)
+        self._insert_rows(ProvidedItem.__table__, pitem_rows)
+        return pkg_keys
+
+    def _get_known_packages(self, dbdistro):
+        """ Get a (version id, distro id)->(distro package id, pkgname) map of the packages we have for a release """
+        known = dict()
+        dpkg_q = db.session.query(DistroPackage.id, DistroPackage.version_id, DistroPackage.distro_id, DistroPackage.pkgname) \
+                    .filter(DistroPackage.distro_id == dbdistro.id)
+        for dpkg_id, ver_id, distro_id, pkgname in dpkg_q:
+            known[(ver_id, distro_id)] = (dpkg_id, pkgname)
+        return known
+
+    def _remove_stale_packages(self, known, current):
+        """ Remove the known packages which are not part of a release anymore """
+        stale_dpkg_ids = list()
+        stale_ver_ids = set()
+        renamed = list()
+        for key, (dpkg_id, pkgname) in known.items():
+            if key not in current:
+                stale_dpkg_ids.append(dpkg_id)
+                stale_ver_ids.add(key[0])
+            elif pkgname not in current[key]:
+                # the version is still shipped, but by another binary package
+                new_name = sorted(current[key].keys())[0]
+                renamed.append({'dpkg_id': dpkg_id, 'name': new_name, 'url': current[key][new_name]})
+        self._delete_rows(DistroPackage.__table__, DistroPackage.id, stale_dpkg_ids)
+        if renamed:
+            table = DistroPackage.__table__
+            db.session.execute(table.update().where(table.c.id == bindparam('dpkg_id')) \
+                                    .values(pkgname=bindparam('name'), package_url=bindparam('url')),
+                               renamed)
+
+        # drop versions which are not shipped by any distribution anymore
+        ver_q = db.session.query(DistroPackage.version_id)
+        orphans = stale_ver_ids - set([ver_id for (ver_id,) in self._query_in(ver_q, DistroPackage.version_id, stale_ver_ids)])
+        cpt_q = db.session.query(ComponentVersion.component_id)
+        affected_cpt_ids = set([cpt_id for (cpt_id,) in self._query_in(cpt_q, ComponentVersion.id, orphans)])
+        self._delete_rows(ProvidedItem.__table__, ProvidedItem.version_id, orphans)
+        self._delete_rows(ComponentVersion.__table__, ComponentVersion.id, orphans)
+        self._reset_highest_versions(affected_cpt_ids)
+
+    def _reset_highest_versions(self, cpt_ids):
+        """ Point the highest version of components which lost versions at the highest one left,
+        and remove components which have no versions left at all """
+        highest = dict()
+        ver_q = db.session.query(ComponentVersion.component_id, ComponentVersion.version, ComponentVersion.version_key)
+        for cpt_id, version, key in self._query_in(ver_q, ComponentVersion.component_id, cpt_ids):
+            if cpt_id not in highest or key > highest[cpt_id][1]:
+                highest[cpt_id] = (version, key)
+
+        # the component data is refreshed when a release shipping that version is imported again
+        if highest:
+            table = Component.__table__
+            db.session.execute(table.update().where(table.c.id == bindparam('cpt_id')) \
+                                    .values(highest_version=bindparam('version'), highest_version_key=bindparam('key')),
+                               [{'cpt_id': cpt_id, 'version': version, 'key': key}
+                                for cpt_id, (version, key) in highest.items()])
+        empty = [cpt_id for cpt_id in cpt_ids if cpt_id not in highest]
+        self._delete_rows(Screenshot.__table__, Screenshot.component_id, empty)
+        self._delete_rows(Component.__table__, Component.id, empty)
+
+        # components loaded by earlier batches must not keep the old values
+        db.session.expire_all()
+
+    def update_components_packages(self, distro):
+        distro_name = distro.get_name()
+
+        # find releases whose input data changed since the last import
+        changed = dict()
+        for release in distro.get_releases():
+            codename = release['codename']
+            dbdistro = db.session.query(Distribution).filter_by(codename=codename, name=distro_name).one()
+            fingerprint = distro.get_release_fingerprint(codename)
+            if fingerprint and fingerprint == dbdistro.fingerprint:
+                print("Skipping %s %s: Data is unchanged" % (distro_name, codename))
+                continue
+            changed[codename] = (dbdistro, fingerprint)
+        if not changed:
+            return
+
+        print("Adding data for: %s (%s)" % (distro_name, ", ".join(changed.keys())))
+
+        # releases we imported before only need their differences applied; packages are
+        # identified by (version id, distro id), as there is one distro package row per pair
+        known = dict()
+        for codename, (dbdistro, fingerprint) in changed.items():
+            known.update(self._get_known_packages(dbdistro))
+        known_dpkgs = set(known.keys())
+        current = dict()
 
-                ver.provided_items.append(pitem)
-                pitem.kind = kind_str
-                pitem.value = value
-                db.session.add(pitem)
-    db.session.commit()
+        # import packages in batches while the distro is still reading them. All packages
+        # go through the import, so changed AppStream data of known versions is applied,
+        # but rows of known distro packages are neither looked up nor written again.
+        for batch in _batches(distro.get_components_packages(changed.keys()), IMPORT_BATCH_SIZE):
+            for key, names in self._import_packages(distro_name, batch, known_dpkgs).items():
+                current.setdefault(key, dict()).update(names)
+            db.session.flush()
+
+        self._remove_stale_packages(known, current)
+        for codename, (dbdistro, fingerprint) in changed.items():
+            dbdistro.fingerprint = fingerprint
+        db.session.flush()
+
+    def _run_cache_update_task(self, task):
+        distro, description, func = task
+        print("Updating cache: %s %s" % (distro.get_name(), description))
+        try:
+            func()
+        except Exception as e:
+            return "%s: %s" % (type(e).__name__, e)
+        return None
+
+    def update_caches(self, distros):
+        """ Update the caches of all distros concurrently, returning the distros which failed to update """
+        tasks = list()
+        for distro in distros:
+            for description, func in distro.get_cache_update_tasks():
+                tasks.append((distro, description, func))
+
+        pool = ThreadPool(self.workers)
+        try:
+            results = pool.map(self._run_cache_update_task, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        failed = list()
+        for (distro, description, func), error in zip(tasks, results):
+            if not error:
+                continue
+            print("Failed to update cache for %s %s: %s" % (distro.get_name(), description, error))
+            if distro not in failed:
+                failed.append(distro)
+        return failed
+
+    def _check_icons(self):
+        """ Bring the stored icon names in sync with the icon cache.
+
+        Icons which vanished from the cache are forgotten, as the web frontend
+        trusts the stored names.
+        """
+        cached_icons = set(os.listdir(self.icon_cache_path))
+        missing = list()
+        for cpt_id, icon_url in db.session.query(Component.id, Component.icon_url).filter(Component.icon_url != ""):
+            if icon_url not in cached_icons:
+                missing.append(cpt_id)
+            elif not ICON_NAME_RE.match(icon_url):
+                # stored by an older version of Figment, before icons were named after their content
+                try:
+                    icon_url = self._store_icon(os.path.join(self.icon_cache_path, icon_url))
+                except (IOError, OSError):
+                    icon_url = ""
+                db.session.execute(Component.__table__.update().where(Component.id == cpt_id).values(icon_url=icon_url))
+        for chunk in _batches(missing, IN_QUERY_CHUNK_SIZE):
+            db.session.execute(Component.__table__.update().where(Component.id.in_(chunk)).values(icon_url=""))
+
+    def _remove_unused_icons(self):
+        """ Remove the icons no component uses anymore from the icon cache.
+
+        This must only run after the import was committed, so the database
+        never points at icons which were already removed.
+        """
+        used_icons = set([icon_url for (icon_url,) in db.session.query(Component.icon_url).distinct()])
+        for fname in os.listdir(self.icon_cache_path):
+            if fname not in used_icons:
+                os.remove(os.path.join(self.icon_cache_path, fname))
+
+    def _bump_generation(self):
+        """ Mark the data as changed, so the web frontend drops its cached pages """
+        info = db.session.query(DataInfo).order_by(DataInfo.id).first()
+        if not info:
+            info = DataInfo(generation=0)
+            db.session.add(info)
+        info.generation = (info.generation or 0) + 1
+        info.last_update = datetime.utcnow()
 
     def import_data(self):
         distros = list()
@@ -145,8 +462,12 @@ class DatabaseUpdater:
         distros.append(FedoraDataRetriever())
         distros.append(TangluDataRetriever())
 
+        # don't import partially updated data
+        for distro in self.update_caches(distros):
+            print("Skipping %s: Cache update failed" % (distro.get_name()))
+            distros.remove(distro)
+
         for distro in distros:
-            distro.update_caches()
             for release in distro.get_releases():
                 d = db.session.query(Distribution).filter_by(codename=release['codename'], name=distro.get_name()).first()
                 if d:
@@ -160,4 +481,8 @@ class DatabaseUpdater:
         # finalize and commit data
         for distro in distros:
             self.update_components_packages(distro)
+        self._check_icons()
+        rebuild_search_index()
+        self._bump_generation()
         db.session.commit()
+        self._remove_unused_icons()
@@ -8,3 +8,4 @@ app = Flask("figment", template_folder=tmpl_dir, static_folder=static_dir)
 app.config.from_object('config')
 
 from figment import views
+from figment import api
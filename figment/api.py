@@ -0,0 +1,119 @@
+from flask import jsonify, request
+from sqlalchemy import or_, and_
+from figment import app
+from database import db
+from models import *
+from search import search_components
+from cache import cached_view
+from sqlalchemy.orm import undefer
+from werkzeug.urls import url_unquote
+from views import component_to_item, get_version_data, paginate, summary_query, provides_query, SUMMARY_COLUMNS
+
+# SQLite can not bind more than 999 parameters per statement
+BATCH_QUERY_CHUNK_SIZE = 400
+
+def _error(message, status):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+def _component_details(cpt):
+    versions = list()
+    for ver, vpdata, distros in get_version_data(cpt):
+        versions.append({'version': ver.version,
+                         'provides': vpdata,
+                         'packages': distros})
+
+    return {'identifier': cpt.identifier,
+            'kind': cpt.kind,
+            'name': cpt.name,
+            'summary': cpt.summary,
+            'description': cpt.description,
+            'developer': cpt.developer_name,
+            'license': cpt.license,
+            'homepage': cpt.homepage,
+            'highest_version': cpt.highest_version,
+            'versions': versions}
+
+def _chunks(values):
+    values = list(values)
+    for i in range(0, len(values), BATCH_QUERY_CHUNK_SIZE):
+        yield values[i:i + BATCH_QUERY_CHUNK_SIZE]
+
+@app.route('/api/v1/component/<identifier>')
+@cached_view
+def api_component(identifier):
+    cpt = db.session.query(Component).options(undefer('description')).filter_by(identifier=identifier).first()
+    if not cpt:
+        return _error("Component not found: %s" % (identifier), 404)
+    return jsonify(component=_component_details(cpt))
+
+@app.route('/api/v1/search/<search_str>')
+@cached_view
+def api_search(search_str):
+    search_str = url_unquote(search_str)
+    cpts, pager = paginate(summary_query(search_components(search_str)))
+    return jsonify(components=[component_to_item(cpt) for cpt in cpts], pager=pager)
+
+# values like mimetypes contain slashes, so they may be given as they are, or quoted like for the HTML views
+@app.route('/api/v1/provides/<kind>/<path:value>')
+@cached_view
+def api_provides(kind, value):
+    value = url_unquote(value)
+    rows, pager = paginate(provides_query(kind, value))
+
+    items = list()
+    for row in rows:
+        item = component_to_item(row)
+        item['version'] = row.version
+        items.append(item)
+    return jsonify(components=items, pager=pager)
+
+@app.route('/api/v1/batch', methods=['POST'])
+def api_batch():
+    """ Resolve many identifiers and provided items at once.
+
+    Expects a JSON object with an "identifiers" list and/or a "provides" list
+    of [kind, value] pairs.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _error("Expected a JSON object", 400)
+    identifiers = data.get('identifiers', list())
+    provides = data.get('provides', list())
+    if not isinstance(identifiers, list) or not isinstance(provides, list):
+        return _error("'identifiers' and 'provides' must be lists", 400)
+    if len(identifiers) + len(provides) > app.config.get('API_BATCH_MAX_ITEMS', 10000):
+        return _error("Too many items in batch request", 413)
+
+    if not all([isinstance(identifier, basestring) for identifier in identifiers]):
+        return _error("Identifiers must be strings", 400)
+    pairs = set()
+    for pair in provides:
+        if not isinstance(pair, list) or len(pair) != 2 or \
+                not all([isinstance(part, basestring) for part in pair]):
+            return _error("Provided items must be [kind, value] pairs", 400)
+        pairs.add((pair[0], pair[1]))
+
+    cpt_results = dict()
+    for chunk in _chunks(set(identifiers)):
+        for cpt in db.session.query(*SUMMARY_COLUMNS).filter(Component.identifier.in_(chunk)):
+            cpt_results[cpt.identifier] = component_to_item(cpt)
+
+    # group the values by kind, so the (kind, value) index can be used for each of them
+    provides_results = dict()
+    for chunk in _chunks(pairs):
+        values_by_kind = dict()
+        for kind, value in chunk:
+            values_by_kind.setdefault(kind, list()).append(value)
+        q = db.session.query(ProvidedItem.kind, ProvidedItem.value, Component.identifier, ComponentVersion.version) \
+                .join(ComponentVersion, ProvidedItem.version_id == ComponentVersion.id) \
+                .join(Component, ComponentVersion.component_id == Component.id) \
+                .filter(or_(*[and_(ProvidedItem.kind == kind, ProvidedItem.value.in_(values))
+                              for kind, values in values_by_kind.items()])) \
+                .order_by(ProvidedItem.id)
+        for kind, value, identifier, version in q:
+            provides_results.setdefault(kind, dict()).setdefault(value, list()).append({'identifier': identifier,
+                                                                                        'version': version})
+
+    return jsonify(components=cpt_results, provides=provides_results)
@@ -0,0 +1,115 @@
+import time
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import request, make_response
+from werkzeug.contrib.cache import BaseCache, NullCache, MemcachedCache, RedisCache
+from figment import app
+from database import db
+from models import DataInfo
+
+class LRUCache(BaseCache):
+    """ In-process cache, dropping the least recently used entries once it is full """
+
+    def __init__(self, max_entries=1000, default_timeout=300):
+        BaseCache.__init__(self, default_timeout)
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                return None
+            # re-insert, to mark the entry as recently used
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return True
+
+def _create_cache():
+    cache_type = app.config.get('CACHE_TYPE', 'simple')
+    timeout = app.config.get('CACHE_TIMEOUT', 300)
+    if cache_type == 'memcached':
+        return MemcachedCache(app.config.get('CACHE_MEMCACHED_SERVERS', ['127.0.0.1:11211']),
+                              default_timeout=timeout, key_prefix='figment:')
+    elif cache_type == 'redis':
+        return RedisCache(app.config.get('CACHE_REDIS_HOST', 'localhost'),
+                          app.config.get('CACHE_REDIS_PORT', 6379),
+                          default_timeout=timeout, key_prefix='figment:')
+    elif cache_type == 'null':
+        return NullCache()
+    return LRUCache(app.config.get('CACHE_SIZE', 1000), timeout)
+
+cache = _create_cache()
+
+def get_data_info():
+    """ Get the generation of the data, which changes with every import, and the time of the last import """
+    info = db.session.query(DataInfo.generation, DataInfo.last_update).order_by(DataInfo.id).first()
+    if not info:
+        return (0, None)
+    return (info[0] or 0, info[1])
+
+def _set_cache_headers(response, etag, last_update):
+    response.set_etag(etag)
+    if last_update:
+        response.last_modified = last_update
+    response.headers['Cache-Control'] = "public, max-age=%d" % (app.config.get('HTTP_CACHE_MAX_AGE', 60))
+    return response
+
+def cached_view(f):
+    """ Cache the pages rendered by a view until the next import changes the data,
+    and let clients revalidate their copies with a cheap conditional GET """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if request.method != 'GET':
+            return f(*args, **kwargs)
+
+        # the page only depends on the path and the data, so this is a strong validator
+        generation, last_update = get_data_info()
+        etag = hashlib.sha1(("%d:%s" % (generation, request.full_path)).encode('utf-8')).hexdigest()
+        if request.if_none_match.contains(etag):
+            return _set_cache_headers(app.response_class(status=304), etag, last_update)
+
+        # the ETag doubles as key, as memcached does not like long keys or whitespace
+        key = "view:%s:%s" % (f.__name__, etag)
+        page = cache.get(key)
+        if page is None:
+            rv = f(*args, **kwargs)
+            if isinstance(rv, basestring):
+                page = (rv, None)
+            elif isinstance(rv, app.response_class) and rv.status_code == 200:
+                page = (rv.get_data(), rv.mimetype)
+            else:
+                # redirects and errors are not cached
+                return rv
+            cache.set(key, page)
+        data, mimetype = page
+        response = make_response(data)
+        if mimetype:
+            response.mimetype = mimetype
+        return _set_cache_headers(response, etag, last_update)
+    return decorated
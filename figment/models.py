@@ -1,7 +1,7 @@
 
 import json
 from database import db
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, DateTime
 
 class Component(db.Model):
     __tablename__ = 'components'
@@ -11,12 +11,15 @@ class Component(db.Model):
     kind = Column(String)
     name = Column(String)
     summary = Column(String)
-    description = Column(String)
+    # only loaded on access, result lists never show it
+    description = db.deferred(Column(String))
     icon_url = Column(String)
     developer_name = Column(String)
     license = Column(String)
     homepage = Column(String)
     highest_version = Column(String)
+    # sort key of highest_version, see cptmatch.helpers.version
+    highest_version_key = Column(String)
     versions = db.relationship('ComponentVersion', backref='component',
                                 lazy='dynamic', cascade="all, delete, delete-orphan")
     screenshots = db.relationship('Screenshot', backref='component',
@@ -28,10 +31,16 @@ class Component(db.Model):
 
 class ComponentVersion(db.Model):
     __tablename__ = 'component_versions'
+    __table_args__ = (
+        db.Index('ix_component_versions_component_version', 'component_id', 'version', unique=True),
+        db.Index('ix_component_versions_component_version_key', 'component_id', 'version_key'),
+    )
 
     id = Column(Integer, primary_key=True)
     component_id = db.Column(db.Integer, db.ForeignKey('components.id'))
     version = Column(String)
+    # sort key of version, see cptmatch.helpers.version
+    version_key = Column(String)
 
     provided_items = db.relationship('ProvidedItem', backref='version',
                                 lazy='dynamic', cascade="all, delete, delete-orphan")
@@ -40,6 +49,10 @@ class ComponentVersion(db.Model):
 
 class ProvidedItem(db.Model):
     __tablename__ = 'provided_items'
+    __table_args__ = (
+        db.Index('ix_provided_items_kind_value', 'kind', 'value'),
+        db.Index('ix_provided_items_version_kind_value', 'version_id', 'kind', 'value', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     version_id = db.Column(db.Integer, db.ForeignKey('component_versions.id'))
@@ -48,12 +61,18 @@ class ProvidedItem(db.Model):
 
 class Screenshot(db.Model):
     __tablename__ = 'screenshots'
+    __table_args__ = (
+        db.Index('ix_screenshots_component_id', 'component_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     component_id = db.Column(db.Integer, db.ForeignKey('components.id'))
     default = Column(Boolean)
     caption = Column(String)
     images = Column(String)
+    # images shown on the component page, picked from images by the updater
+    url_thumb = Column(String)
+    url_large = Column(String)
 
     _img_data = list()
 
@@ -66,19 +85,41 @@ class Screenshot(db.Model):
             self._img_data = json.loads(self.images)
         return self._img_data
 
+    @staticmethod
+    def pick_image_urls(images):
+        """ Select the thumbnail and the large image from a list of image data """
+        url_thumb = ""
+        url_large = ""
+        max_height = 0
+        for img in images:
+            if img['height'] <= 200:
+                url_thumb = img['url']
+            elif img['height'] > max_height:
+                url_large = img['url']
+            max_height = img['height']
+        return (url_thumb, url_large)
+
 class Distribution(db.Model):
     __tablename__ = 'distributions'
+    __table_args__ = (
+        db.Index('ix_distributions_codename_name', 'codename', 'name', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
     version = Column(String)
     codename = Column(String)
+    # checksum of the data this release was last imported from
+    fingerprint = Column(String)
 
     packages = db.relationship('DistroPackage', backref='distribution',
                                 lazy='dynamic', cascade="all, delete, delete-orphan")
 
 class DistroPackage(db.Model):
     __tablename__ = 'distro_packages'
+    __table_args__ = (
+        db.Index('ix_distro_packages_version_distro', 'version_id', 'distro_id', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     version_id = db.Column(db.Integer, db.ForeignKey('component_versions.id'))
@@ -86,3 +127,11 @@ class DistroPackage(db.Model):
 
     pkgname = Column(String)
     package_url = Column(String)
+
+class DataInfo(db.Model):
+    __tablename__ = 'data_info'
+
+    id = Column(Integer, primary_key=True)
+    # incremented by every import, cached pages of older generations are stale
+    generation = Column(Integer, default=0)
+    last_update = Column(DateTime)
@@ -0,0 +1,74 @@
+from sqlalchemy import or_, false, bindparam
+from sqlalchemy.sql import table, column, literal_column
+from sqlalchemy.exc import OperationalError
+from database import db
+from models import Component
+
+# external-content FTS5 table for SQLite, the rowid is the component id
+_fts = table('components_fts', column('rowid'), column('rank'))
+
+# document indexed by PostgreSQL, queries must use the very same expression to hit the index
+_PG_DOCUMENT = "to_tsvector('english', coalesce(identifier, '') || ' ' || coalesce(name, '') || ' ' || " \
+               "coalesce(summary, '') || ' ' || coalesce(description, ''))"
+
+_have_fts = False
+
+def _dialect():
+    return db.engine.dialect.name
+
+def _fts_available():
+    global _have_fts
+    if not _have_fts:
+        res = db.session.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='components_fts'")
+        _have_fts = res.first() is not None
+    return _have_fts
+
+def create_search_index():
+    """ Create the full-text index on the components table, if the database supports it """
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        try:
+            db.session.execute("CREATE VIRTUAL TABLE IF NOT EXISTS components_fts USING fts5(" \
+                               "identifier, name, summary, description, " \
+                               "content='components', content_rowid='id')")
+        except OperationalError as e:
+            print("Full-text search is not available, falling back to slow searches: %s" % (e))
+    elif dialect == 'postgresql':
+        db.session.execute("CREATE INDEX IF NOT EXISTS ix_components_fts ON components USING gin(%s)" % (_PG_DOCUMENT))
+
+def rebuild_search_index():
+    """ Resynchronize the full-text index with the components table """
+    if _dialect() == 'sqlite' and _fts_available():
+        db.session.execute("INSERT INTO components_fts(components_fts) VALUES('rebuild')")
+    # the PostgreSQL index is an expression index and always up to date
+
+def _fts5_query(search_str):
+    # quote every term, so user input can not inject FTS syntax, and match term prefixes
+    terms = list()
+    for term in search_str.split():
+        terms.append('"%s"*' % (term.replace('"', '""')))
+    return " ".join(terms)
+
+def search_components(search_str):
+    """ Return a query for all components matching search_str, best matches first """
+    dialect = _dialect()
+    if dialect == 'sqlite' and _fts_available():
+        match = _fts5_query(search_str)
+        if not match:
+            return db.session.query(Component).filter(false())
+        return db.session.query(Component) \
+                    .join(_fts, Component.id == _fts.c.rowid) \
+                    .filter(literal_column('components_fts').op('MATCH')(bindparam('fts_query', match))) \
+                    .order_by(_fts.c.rank)
+    elif dialect == 'postgresql':
+        document = literal_column(_PG_DOCUMENT)
+        tsquery = db.func.plainto_tsquery('english', search_str)
+        return db.session.query(Component) \
+                    .filter(document.op('@@')(tsquery)) \
+                    .order_by(db.func.ts_rank(document, tsquery).desc())
+
+    pattern = "%" + search_str + "%"
+    return db.session.query(Component).filter(or_(Component.identifier.like(pattern),
+                                                  Component.name.like(pattern),
+                                                  Component.summary.like(pattern),
+                                                  Component.description.like(pattern)))
@@ -1,12 +1,19 @@
 
-from flask import render_template, redirect, Markup, url_for
+from flask import render_template, redirect, Markup, url_for, request, send_from_directory
 from figment import app
 from forms import GetIdForm, SearchForm, SearchItemsForm
 from database import db
 from models import *
 from utils import get_db
+from search import search_components
+from cache import cached_view
+from sqlalchemy.orm import undefer
 from werkzeug.urls import url_quote, url_unquote
-import os.path
+import os
+
+ICON_CACHE_PATH = os.path.join(app.static_folder, "images", "cpt-icons")
+# one year, the longest time HTTP/1.1 clients are asked to keep a response
+ICON_MAX_AGE = 365 * 24 * 60 * 60
 
 @app.route('/', methods=['GET', 'POST'])
 @app.route('/index', methods=['GET', 'POST'])
@@ -30,13 +37,22 @@ def index():
         itemform = itemform)
 
 def get_icon_url(icon_url):
-    if os.path.isfile(os.path.join(app.root_path, "..", "static", "images", "cpt-icons", icon_url)):
-        icon_url = url_for('static', filename="images/cpt-icons/%s" % (icon_url))
+    # the updater only stores icon names of icons it copied into the icon cache,
+    # so we don't need to look at the filesystem here
+    if icon_url:
+        icon_url = url_for('cpt_icon', filename=icon_url)
     else:
         icon_url = url_for('static', filename='images/notfound.png')
 
     return icon_url
 
+@app.route('/icons/<filename>')
+def cpt_icon(filename):
+    # icons are named after their content, so they can be cached forever
+    response = send_from_directory(ICON_CACHE_PATH, filename, cache_timeout=ICON_MAX_AGE)
+    response.headers['Cache-Control'] = "public, max-age=%d, immutable" % (ICON_MAX_AGE)
+    return response
+
 def provides_type_text(kind):
     MAPPING = {'mimetype': "Mimetypes",
                'codec': "Codec",
@@ -47,10 +63,44 @@ def provides_type_text(kind):
         text = kind
     return text
 
+def get_version_data(cpt):
+    """ Get all versions of a component, newest first, with their provided items and distro packages """
+    # fetch all versions of this component, and everything attached to them, with
+    # one query per table, instead of walking the lazy relations per version
+    versions = db.session.query(ComponentVersion).filter_by(component_id=cpt.id) \
+                    .order_by(ComponentVersion.version_key.desc()).all()
+    version_ids = [ver.id for ver in versions]
+
+    pdata = dict()
+    distro_data = dict()
+    if version_ids:
+        pitems_q = db.session.query(ProvidedItem) \
+                    .filter(ProvidedItem.version_id.in_(version_ids)) \
+                    .order_by(ProvidedItem.id)
+        for pi in pitems_q:
+            vpdata = pdata.setdefault(pi.version_id, dict())
+            if not vpdata.get(pi.kind):
+                vpdata[pi.kind] = list()
+            vpdata[pi.kind].append(pi.value)
+
+        dpkgs_q = db.session.query(DistroPackage, Distribution) \
+                    .join(Distribution, DistroPackage.distro_id == Distribution.id) \
+                    .filter(DistroPackage.version_id.in_(version_ids)) \
+                    .order_by(DistroPackage.id)
+        for distro_pkg, distro in dpkgs_q:
+            distro_data.setdefault(distro_pkg.version_id, list()).append({'name': distro.name,
+                                'version': distro.version,
+                                'codename': distro.codename,
+                                'pkgname': distro_pkg.pkgname,
+                                'pkgurl': distro_pkg.package_url})
+
+    return [(ver, pdata.get(ver.id, dict()), distro_data.get(ver.id, list())) for ver in versions]
+
 @app.route('/get/<identifier>', methods=['GET', 'POST'])
+@cached_view
 def component_page(identifier):
     identifier = url_unquote(identifier)
-    cpt = db.session.query(Component).filter_by(identifier=identifier).first()
+    cpt = db.session.query(Component).options(undefer('description')).filter_by(identifier=identifier).first()
     if not cpt:
         notfound_msg = Markup("Component with identifier <b>%s</b> was not found.") % (identifier)
         return render_template('notfound.html', message = notfound_msg)
@@ -61,15 +111,12 @@ def component_page(identifier):
     screenshots = list()
 
     for shot in cpt.screenshots:
-        imgs = shot.get_image_data()
+        # the images to show were picked by the updater
         sdata = dict()
-        max_height = 0
-        for img in imgs:
-            if img['height'] <= 200:
-                sdata['url_thumb'] = img['url']
-            elif img['height'] > max_height:
-                sdata['url_large'] = img['url']
-            max_height = img['height']
+        if shot.url_thumb:
+            sdata['url_thumb'] = shot.url_thumb
+        if shot.url_large:
+            sdata['url_large'] = shot.url_large
         if sdata:
             if shot.caption:
                 sdata['caption'] = shot.caption
@@ -79,28 +126,14 @@ def component_page(identifier):
 
     veritems = list()
     v_internal_id = 1
-    for ver in cpt.versions:
+    for ver, vpdata, distros in get_version_data(cpt):
         pitems = list()
-        pdata = dict()
-        distro_data = list()
-        for pi in ver.provided_items:
-            if not pdata.get(pi.kind):
-                pdata[pi.kind] = list()
-            pdata[pi.kind].append(pi.value)
-
-        for distro_pkg in ver.packages:
-            distro = db.session.query(Distribution).filter_by(id=distro_pkg.distro_id).one()
-            distro_data.append({'name': distro.name,
-                                'version': distro.version,
-                                'codename': distro.codename,
-                                'pkgurl': distro_pkg.package_url})
-
-        for kind in pdata.keys():
-            pitems.append({'typename': provides_type_text(kind), 'values': pdata[kind]})
+        for kind in vpdata.keys():
+            pitems.append({'typename': provides_type_text(kind), 'values': vpdata[kind]})
 
         veritems.append({'version': ver.version,
                 'provides': pitems,
-                'distros': distro_data,
+                'distros': distros,
                 'version_id': v_internal_id})
         v_internal_id += 1
 
@@ -121,6 +154,13 @@ def component_page(identifier):
         title = cpt.name,
         item = item)
 
+# the only columns result lists need, so we neither load descriptions nor build ORM objects for them
+SUMMARY_COLUMNS = (Component.kind, Component.identifier, Component.name, Component.summary, Component.icon_url)
+
+def summary_query(query):
+    """ Restrict a query for components to the columns component_to_item() uses """
+    return query.with_entities(*SUMMARY_COLUMNS)
+
 def component_to_item(cpt):
     icon_url = get_icon_url(cpt.icon_url)
 
@@ -133,10 +173,32 @@ def component_to_item(cpt):
     }
     return item
 
+def paginate(query):
+    """ Get the rows of the requested page of a query, and the data for the pager.
+
+    Counting stops at MAX_RESULTS, and no page beyond it is served, so short
+    search terms can not make us load a whole table.
+    """
+    page_size = app.config.get('PAGE_SIZE', 48)
+    max_results = app.config.get('MAX_RESULTS', 1000)
+
+    total = db.session.query(db.func.count()).select_from(query.limit(max_results + 1).subquery()).scalar()
+    pages = max(1, (min(total, max_results) + page_size - 1) // page_size)
+    page = min(max(request.args.get('page', 1, type=int), 1), pages)
+
+    offset = (page - 1) * page_size
+    rows = query.offset(offset).limit(min(page_size, max_results - offset)).all()
+    pager = {'page': page,
+             'pages': pages,
+             'total': min(total, max_results),
+             'more': total > max_results}
+    return (rows, pager)
+
 @app.route('/search/<search_str>', methods=['GET', 'POST'])
+@cached_view
 def component_search(search_str):
     search_str = url_unquote(search_str)
-    cpts = db.session.query(Component).filter(Component.description.like("%"+search_str+"%")).all()
+    cpts, pager = paginate(summary_query(search_components(search_str)))
     if not cpts:
         notfound_msg = Markup("Could not find software matching the search terms: <b>%s</b>") % (search_str)
         return render_template('notfound.html', message = notfound_msg)
@@ -147,24 +209,33 @@ def component_search(search_str):
 
     return render_template('results.html',
         title = "Search results",
-        items = items)
+        items = items,
+        pager = pager)
+
+def provides_query(kind, value):
+    """ Get a query for the summaries and versions of all components providing an item """
+    return db.session.query(ComponentVersion.version, *SUMMARY_COLUMNS) \
+                .join(Component, ComponentVersion.component_id == Component.id) \
+                .join(ProvidedItem, ProvidedItem.version_id == ComponentVersion.id) \
+                .filter(ProvidedItem.kind == kind, ProvidedItem.value == value) \
+                .order_by(ProvidedItem.id)
 
 @app.route('/provides/<kind>/<value>', methods=['GET', 'POST'])
+@cached_view
 def find_feature(kind, value):
     value = url_unquote(value)
-    feature_items = db.session.query(ProvidedItem).filter_by(kind=kind, value=value).all()
-    print value
-    if not feature_items:
+    rows, pager = paginate(provides_query(kind, value))
+    if not rows:
         notfound_msg = Markup("Could not find software providing \"<b>[<i>%s</i>] %s</b>\"") % (kind, value)
         return render_template('notfound.html', message = notfound_msg)
 
     items = list()
-    for feature_item in feature_items:
-        cpt = feature_item.version.component
-        item = component_to_item(cpt)
-        item['name'] = "%s (%s)" % (item['name'], feature_item.version.version)
+    for row in rows:
+        item = component_to_item(row)
+        item['name'] = "%s (%s)" % (item['name'], row.version)
         items.append(item)
 
     return render_template('results.html',
         title = "Search results",
-        items = items)
+        items = items,
+        pager = pager)
@@ -1,3 +1,24 @@
 CSRF_ENABLED = True
 SECRET_KEY = 'you-will-never-guess'
 SQLALCHEMY_DATABASE_URI = "sqlite:///test.db"
+
+# number of parallel jobs used when updating the database
+UPDATE_WORKERS = 4
+
+# cache for rendered pages: 'simple' (in-process), 'memcached', 'redis' or 'null'
+CACHE_TYPE = 'simple'
+CACHE_SIZE = 1000
+CACHE_TIMEOUT = 300
+#CACHE_MEMCACHED_SERVERS = ['127.0.0.1:11211']
+#CACHE_REDIS_HOST = 'localhost'
+#CACHE_REDIS_PORT = 6379
+
+# seconds browsers and proxies may use a page before revalidating it
+HTTP_CACHE_MAX_AGE = 60
+
+# number of results shown per page, and the most results a search can return
+PAGE_SIZE = 48
+MAX_RESULTS = 1000
+
+# most identifiers and provided items a single API batch request may ask for
+API_BATCH_MAX_ITEMS = 10000
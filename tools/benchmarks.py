@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# Measure the costs the package cache, the database indexes and the provides
+# lookup were optimized for, on a synthetic catalogue of a realistic size.
+#
+# Usage: python tools/benchmarks.py [--components N] [--packages N]
+import os
+import sys
+import gzip
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+from argparse import ArgumentParser
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cptmatch.helpers.distro import PackageInfo
+from cptmatch.helpers.pkgcache import PackageCacheWriter, PackageCacheReader
+
+class DictPackageInfo():
+    """ PackageInfo as it was before it became a slots class """
+    def __init__(self, name, version, upstream_version, arch, distro_release):
+        self.name = name
+        self.version = version
+        self.arch = arch
+        self.source_package = None
+        self.upstream_version = upstream_version
+        self.distro_release = distro_release
+
+        self.url = "#"
+
+        self.cpt = None
+
+def _timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return (time.time() - start, result)
+
+def _print_result(label, value):
+    print("  %-52s %s" % (label, value))
+
+def make_packages(count):
+    pkgs = list()
+    for i in range(count):
+        # build the strings the way a parser would, so equal values are no shared objects
+        pkg = PackageInfo(u"package-%d" % (i), u"%d:1.%d-1.fc21" % (i % 3, i), u"1.%d" % (i),
+                          u"".join(["x86", "_64"]), u"".join(["fedora", "-21"]))
+        pkg.url = u"http://example.org/packages/package-%d/" % (i)
+        if i % 4:
+            pkg.source_package = u"source-%d" % (i / 4)
+        pkgs.append(pkg)
+    return pkgs
+
+def bench_package_cache(pkgs):
+    print("Package cache, %d packages:" % (len(pkgs)))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fn_yaml = os.path.join(tmpdir, "packages.gz")
+        fn_bin = os.path.join(tmpdir, "packages.bin")
+
+        def write_yaml():
+            f = gzip.GzipFile(fn_yaml, "w")
+            for pkg in pkgs:
+                f.write(pkg.to_yaml())
+            f.close()
+
+        def read_yaml():
+            return len(list(yaml.load_all(gzip.open(fn_yaml, 'r'))))
+
+        def write_bin():
+            writer = PackageCacheWriter(open(fn_bin, "wb"))
+            for pkg in pkgs:
+                writer.write(pkg)
+            writer.close()
+
+        def read_bin():
+            return len(list(PackageCacheReader(open(fn_bin, "rb"))))
+
+        for label, write, read, fn in [("YAML (packages.gz)", write_yaml, read_yaml, fn_yaml),
+                                       ("binary (packages.bin)", write_bin, read_bin, fn_bin)]:
+            t_write, _ = _timed(write)
+            t_read, count = _timed(read)
+            assert count == len(pkgs)
+            _print_result(label, "write %7.3fs  read %7.3fs  %6d KiB" % (t_write, t_read,
+                                                                        os.path.getsize(fn) / 1024))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def _memory_per_object(objs):
+    """ Get the bytes per object, counting each referenced string object once """
+    total = 0
+    seen = set()
+    for obj in objs:
+        total += sys.getsizeof(obj)
+        if hasattr(obj, '__dict__'):
+            total += sys.getsizeof(obj.__dict__)
+            values = obj.__dict__.values()
+        else:
+            values = [getattr(obj, slot) for slot in obj.__slots__]
+        for value in values:
+            if isinstance(value, basestring) and id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+    return total / len(objs)
+
+def bench_package_info(pkgs):
+    print("PackageInfo memory:")
+    old = list()
+    for pkg in pkgs:
+        p = DictPackageInfo(pkg.name, pkg.version, pkg.upstream_version,
+                            u"".join(["x86", "_64"]), u"".join(["fedora", "-21"]))
+        p.url = pkg.url
+        p.source_package = pkg.source_package
+        old.append(p)
+    _print_result("dict based", "%d bytes per package" % (_memory_per_object(old)))
+    _print_result("slots, interned fields", "%d bytes per package" % (_memory_per_object(pkgs)))
+
+def make_database(n_components):
+    """ Build a catalogue with the schema of figment/models.py, without its indexes """
+    random.seed(1)
+    db = sqlite3.connect(':memory:')
+    c = db.cursor()
+    c.executescript("""
+    CREATE TABLE components (id INTEGER PRIMARY KEY, identifier VARCHAR UNIQUE, kind VARCHAR, name VARCHAR,
+                             summary VARCHAR, description VARCHAR, icon_url VARCHAR);
+    CREATE TABLE component_versions (id INTEGER PRIMARY KEY, component_id INTEGER, version VARCHAR,
+                                     version_key VARCHAR);
+    CREATE TABLE provided_items (id INTEGER PRIMARY KEY, version_id INTEGER, kind VARCHAR, value VARCHAR);
+    CREATE TABLE screenshots (id INTEGER PRIMARY KEY, component_id INTEGER, caption VARCHAR);
+    CREATE TABLE distributions (id INTEGER PRIMARY KEY, name VARCHAR, version VARCHAR, codename VARCHAR);
+    CREATE TABLE distro_packages (id INTEGER PRIMARY KEY, version_id INTEGER, distro_id INTEGER,
+                                  pkgname VARCHAR, package_url VARCHAR);
+    """)
+    c.executemany("INSERT INTO components VALUES (?,?,?,?,?,?,?)",
+                  [(i, "app%d.desktop" % (i), "desktop", "App %d" % (i), "summary", "d" * 300, "")
+                   for i in range(1, n_components + 1)])
+    versions = [(i * 2 - j, i, "1.%d" % (j), "1.%d" % (j)) for i in range(1, n_components + 1) for j in (0, 1)]
+    c.executemany("INSERT INTO component_versions VALUES (?,?,?,?)", versions)
+
+    values = ["text/plain"] + ["application/x-type%d" % (k) for k in range(5000)]
+    items = set()
+    for vid, cid, _, _ in versions:
+        # every 7th component handles a popular mimetype
+        if cid % 7 == 0:
+            items.add((vid, "mimetype", "text/plain"))
+        for k in range(4):
+            items.add((vid, ["mimetype", "bin", "lib"][k % 3], random.choice(values[1:])))
+    c.executemany("INSERT INTO provided_items (version_id, kind, value) VALUES (?,?,?)", sorted(items))
+    c.executemany("INSERT INTO screenshots (component_id, caption) VALUES (?,?)",
+                  [(i, "caption") for i in range(1, n_components + 1)])
+    c.executemany("INSERT INTO distributions VALUES (?,?,?,?)",
+                  [(d, "Distro%d" % (d % 2), str(d), "release%d" % (d)) for d in range(1, 5)])
+    c.executemany("INSERT INTO distro_packages (version_id, distro_id, pkgname, package_url) VALUES (?,?,?,?)",
+                  [(vid, d, "package%d" % (cid), "#") for vid, cid, _, _ in versions
+                   for d in (1 + vid % 4, 1 + (vid + 1) % 4)])
+    db.commit()
+    return db, values
+
+def create_indexes(db):
+    """ Create the indexes declared in figment/models.py """
+    db.executescript("""
+    CREATE UNIQUE INDEX ix_component_versions_component_version ON component_versions (component_id, version);
+    CREATE INDEX ix_component_versions_component_version_key ON component_versions (component_id, version_key);
+    CREATE INDEX ix_provided_items_kind_value ON provided_items (kind, value);
+    CREATE UNIQUE INDEX ix_provided_items_version_kind_value ON provided_items (version_id, kind, value);
+    CREATE INDEX ix_screenshots_component_id ON screenshots (component_id);
+    CREATE UNIQUE INDEX ix_distributions_codename_name ON distributions (codename, name);
+    CREATE UNIQUE INDEX ix_distro_packages_version_distro ON distro_packages (version_id, distro_id);
+    """)
+
+def bench_indexes(db, values, n_components):
+    queries = [
+        ("provides lookup, popular value",
+         "SELECT * FROM provided_items WHERE kind=? AND value=?",
+         lambda: ("mimetype", "text/plain"), 20),
+        ("provides lookup, rare value",
+         "SELECT * FROM provided_items WHERE kind=? AND value=?",
+         lambda: ("mimetype", random.choice(values[1:])), 200),
+        ("updater: version by (component, version)",
+         "SELECT id FROM component_versions WHERE component_id=? AND version=?",
+         lambda: (random.randint(1, n_components), "1.1"), 200),
+        ("updater: highest version of a component",
+         "SELECT max(version_key) FROM component_versions WHERE component_id=?",
+         lambda: (random.randint(1, n_components),), 200),
+        ("updater: package by (version, distro)",
+         "SELECT id FROM distro_packages WHERE version_id=? AND distro_id=?",
+         lambda: (random.randint(1, 2 * n_components), random.randint(1, 4)), 200),
+        ("updater: provided item by (version, kind, value)",
+         "SELECT id FROM provided_items WHERE version_id=? AND kind=? AND value=?",
+         lambda: (random.randint(1, 2 * n_components), "mimetype", "text/plain"), 200),
+        ("updater: screenshots of a component",
+         "SELECT id FROM screenshots WHERE component_id=?",
+         lambda: (random.randint(1, n_components),), 200),
+        ("updater: packages of a release",
+         "SELECT id, version_id FROM distro_packages WHERE distro_id=?",
+         lambda: (random.randint(1, 4),), 10),
+    ]
+
+    def run():
+        timings = list()
+        for label, sql, args, n in queries:
+            start = time.time()
+            for i in range(n):
+                db.execute(sql, args()).fetchall()
+            timings.append((time.time() - start) * 1000.0 / n)
+        return timings
+
+    print("Query times, without -> with indexes:")
+    before = run()
+    create_indexes(db)
+    after = run()
+    for (label, sql, args, n), b, a in zip(queries, before, after):
+        _print_result(label, "%9.3fms -> %7.3fms" % (b, a))
+
+class CountingConnection(object):
+    """ Count the statements sent to the database """
+    def __init__(self, db):
+        self._db = db
+        self.count = 0
+
+    def execute(self, sql, args=()):
+        self.count += 1
+        return self._db.execute(sql, args)
+
+def _provides_traversal(conn, kind, value):
+    """ The lookup as it was done by walking the ORM relations: one query per item and relation """
+    rows = list()
+    for item_id, version_id in conn.execute("SELECT id, version_id FROM provided_items WHERE kind=? AND value=? "
+                                            "ORDER BY id", (kind, value)).fetchall():
+        component_id, version = conn.execute("SELECT component_id, version FROM component_versions WHERE id=?",
+                                             (version_id,)).fetchone()
+        cpt = conn.execute("SELECT identifier, name, summary, icon_url FROM components WHERE id=?",
+                           (component_id,)).fetchone()
+        rows.append((version,) + tuple(cpt))
+    return rows
+
+def _provides_joined(conn, kind, value):
+    """ The lookup done by figment.views.provides_query """
+    return conn.execute("SELECT component_versions.version, components.identifier, components.name, "
+                        "components.summary, components.icon_url FROM component_versions "
+                        "JOIN components ON component_versions.component_id = components.id "
+                        "JOIN provided_items ON provided_items.version_id = component_versions.id "
+                        "WHERE provided_items.kind=? AND provided_items.value=? "
+                        "ORDER BY provided_items.id", (kind, value)).fetchall()
+
+def bench_provides(db, values):
+    print("Provides lookup for a popular value, with indexes:")
+    for label, lookup in [("relation traversal", _provides_traversal),
+                          ("joined query", _provides_joined)]:
+        conn = CountingConnection(db)
+        duration, rows = _timed(lookup, conn, "mimetype", "text/plain")
+        _print_result(label, "%5d queries %9.3fms  (%d results)" % (conn.count, duration * 1000.0, len(rows)))
+
+def main():
+    parser = ArgumentParser(description="Benchmark the package cache, database indexes and provides lookups")
+    parser.add_argument("--components", type=int, default=20000,
+                        help="number of components in the catalogue fixture")
+    parser.add_argument("--packages", type=int, default=50000,
+                        help="number of packages in the package cache fixture")
+    options = parser.parse_args()
+
+    pkgs = make_packages(options.packages)
+    bench_package_cache(pkgs)
+    bench_package_info(pkgs)
+
+    db, values = make_database(options.components)
+    print("Catalogue: %d components, %d versions, %d provided items, %d distro packages" % (
+        options.components,
+        db.execute("SELECT count(*) FROM component_versions").fetchone()[0],
+        db.execute("SELECT count(*) FROM provided_items").fetchone()[0],
+        db.execute("SELECT count(*) FROM distro_packages").fetchone()[0]))
+    bench_indexes(db, values, options.components)
+    bench_provides(db, values)
+
+if __name__ == "__main__":
+    main()